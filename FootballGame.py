@@ -1,10 +1,13 @@
+import tracemalloc
 from functools import lru_cache
 from collections import deque
-from typing import Dict, List, Tuple, Set, Deque, Literal
+from math import gcd
+from typing import Callable, Dict, FrozenSet, List, Tuple, Set, Deque, Literal, NamedTuple, Iterator
 
 States = Dict[str, Dict[str, int]]
 Transitions = Dict[str, List[str]]
 ScoreOn = Literal["current", "entering"]
+Outcome = Literal["win", "tie", "loss"]
 
 def next_yardline(current_yard: int, from_state: str, to_state: str) -> int | None:
     """
@@ -551,6 +554,525 @@ def find_bad_dead_end_states(
     return bad
 
 
+class ProductLayout(NamedTuple):
+    """
+    Bit layout for packing a two-team product state into a single int.
+
+    A product state is (clock, possession, state, yardline, score_a, score_b).
+    The team without the ball always sits in the handoff state ("defense"),
+    so only the possessing team's down state and yard line are stored.
+
+    Fields, from the lowest bits up:
+      possession (1 bit) | state | yardline | score_a | score_b | clock
+
+    The clock is stored in ticks (gcd of every time cost) rather than seconds.
+    `score_bound` caps the points either team can still score, while the score
+    fields are sized for max_start_score + score_bound.
+    """
+    names: Tuple[str, ...]
+    start_time: int
+    turnover_time: int
+    start_yardline: int
+    handoff: str
+    tick: int
+    state_bits: int
+    yard_bits: int
+    score_bits: int
+    score_bound: int
+
+
+def two_team_layout(
+    states: States,
+    transitions: Transitions,
+    start_time: int,
+    turnover_time: int = 30,
+    start_yardline: int = 70,
+    handoff: str = "defense",
+    max_start_score: int = 0,
+) -> ProductLayout:
+    """
+    Build the packed-int layout for the two-team composition of (states, transitions).
+
+    In the product model both teams run the single-team model. When the team with
+    the ball moves into `handoff`, possession flips: the other team leaves its own
+    `handoff` state via transitions[handoff] (new drive, safety or return touchdown).
+    The flat states[handoff]["timeleft"] cost is NOT charged, since the opponent's
+    plays now consume the clock; instead each change of possession costs `turnover_time`.
+
+    Games may start from any score up to `max_start_score` (e.g. a trailing team late
+    in the game); the score fields are sized to hold that plus everything scorable
+    in `start_time`.
+
+    Raises:
+        ValueError if turnover_time is not positive or the model has a cycle of
+        zero-time states, since either would let a team score without the clock moving.
+    """
+    if turnover_time <= 0:
+        raise ValueError("turnover_time must be positive")
+    if max_start_score < 0:
+        raise ValueError("max_start_score must not be negative")
+
+    names = tuple(s for s in states if s != handoff)
+    costs = [states[s]["timeleft"] for s in names] + [turnover_time, start_time]
+    tick = 0
+    for c in costs:
+        tick = gcd(tick, c)
+    tick = tick or 1
+
+    # Most points a team can score in a row of zero-time states starting at s
+    chain: Dict[str, int] = {}
+    on_stack: Set[str] = set()
+
+    def zero_time_points(s: str) -> int:
+        if s in chain:
+            return chain[s]
+        if s in on_stack:
+            raise ValueError(f"zero-time cycle through '{s}'")
+        on_stack.add(s)
+        best = 0
+        for nxt in transitions.get(s, []):
+            if nxt != handoff and states[nxt]["timeleft"] == 0:
+                best = max(best, zero_time_points(nxt))
+        on_stack.remove(s)
+        chain[s] = states[s]["score"] + best
+        return chain[s]
+
+    # Every step that costs time is followed by at most one zero-time scoring run
+    per_step = max(zero_time_points(s) for s in names)
+    min_step = min([c for c in costs[:-1] if c > 0])
+    score_bound = (start_time // min_step + 1) * per_step
+
+    # Yard lines only shrink during a drive, so the widest value is wherever
+    # next_yardline() starts a drive (after a handoff or a safety)
+    max_yardline = start_yardline
+    for s, succ in transitions.items():
+        for nxt in succ:
+            new_y = next_yardline(start_yardline, s, nxt)
+            if new_y is not None:
+                max_yardline = max(max_yardline, new_y)
+
+    return ProductLayout(
+        names=names,
+        start_time=start_time,
+        turnover_time=turnover_time,
+        start_yardline=start_yardline,
+        handoff=handoff,
+        tick=tick,
+        state_bits=max(len(names) - 1, 1).bit_length(),
+        yard_bits=max_yardline.bit_length(),
+        score_bits=max(max_start_score + score_bound, 1).bit_length(),
+        score_bound=score_bound,
+    )
+
+
+def pack_product_state(
+    layout: ProductLayout,
+    clock: int,
+    possession: int,
+    state: str,
+    yardline: int,
+    score_a: int,
+    score_b: int,
+) -> int:
+    """
+    Pack a two-team product state into a single int (see ProductLayout).
+
+    Raises ValueError if a field does not fit the layout, rather than letting it
+    spill into its neighbour.
+    """
+    if clock < 0 or clock % layout.tick:
+        raise ValueError(f"clock {clock} is not a non-negative multiple of {layout.tick}")
+    if clock > layout.start_time:
+        raise ValueError(f"clock {clock} exceeds the layout's start_time {layout.start_time}")
+    if possession not in (0, 1):
+        raise ValueError(f"possession must be 0 or 1, got {possession}")
+    if state not in layout.names:
+        raise ValueError(f"'{state}' is not a product state")
+    if not 0 <= yardline < 1 << layout.yard_bits:
+        raise ValueError(f"yardline {yardline} does not fit in {layout.yard_bits} bits")
+    for score in (score_a, score_b):
+        if not 0 <= score < 1 << layout.score_bits:
+            raise ValueError(f"score {score} does not fit in {layout.score_bits} bits; raise max_start_score")
+
+    code = clock // layout.tick
+    code = (code << layout.score_bits) | score_b
+    code = (code << layout.score_bits) | score_a
+    code = (code << layout.yard_bits) | yardline
+    code = (code << layout.state_bits) | layout.names.index(state)
+    return (code << 1) | possession
+
+
+def unpack_product_state(layout: ProductLayout, code: int) -> Tuple[int, int, str, int, int, int]:
+    """ Inverse of pack_product_state: returns (clock, possession, state, yardline, score_a, score_b). """
+    possession = code & 1
+    code >>= 1
+    state = layout.names[code & ((1 << layout.state_bits) - 1)]
+    code >>= layout.state_bits
+    yardline = code & ((1 << layout.yard_bits) - 1)
+    code >>= layout.yard_bits
+    score_mask = (1 << layout.score_bits) - 1
+    score_a = code & score_mask
+    code >>= layout.score_bits
+    score_b = code & score_mask
+    code >>= layout.score_bits
+    return code * layout.tick, possession, state, yardline, score_a, score_b
+
+
+def canonical_product_state(layout: ProductLayout, code: int) -> int:
+    """
+    Symmetry reduction: the two teams play the same model, so a state where team 1
+    has the ball is equivalent to the state where team 0 has it with the scores swapped.
+    Returns the representative with possession == 0.
+    """
+    if not code & 1:
+        return code
+    clock, _, state, yardline, score_a, score_b = unpack_product_state(layout, code)
+    return pack_product_state(layout, clock, 0, state, yardline, score_b, score_a)
+
+
+def two_team_successors(
+    states: States,
+    transitions: Transitions,
+    layout: ProductLayout,
+    s: str,
+    t: int,
+    y: int,
+) -> Iterator[Tuple[int, bool, str | None, int, int]]:
+    """
+    Successors of the team with the ball playing state s with t time left at yard line y.
+
+    Yields (points, flips, next_state, time_left, yardline) where `points` go to the
+    team that played s and `flips` is True if possession changes. A next_state of
+    None means the game is over.
+    """
+    cost = states[s]["timeleft"]
+    # Not enough time to play s: the game ends before it
+    if t < cost:
+        yield 0, False, None, t, y
+        return
+
+    points = states[s]["score"]
+    rem = t - cost
+    moved = False
+    for nxt in transitions.get(s, []):
+        if nxt == layout.handoff:
+            moved = True
+            if rem < layout.turnover_time:
+                # Clock runs out during the change of possession
+                yield points, False, None, rem, y
+                continue
+            for d in transitions.get(layout.handoff, []):
+                new_y = next_yardline(layout.start_yardline, layout.handoff, d)
+                if new_y is not None:
+                    yield points, True, d, rem - layout.turnover_time, new_y
+            continue
+
+        new_y = next_yardline(y, s, nxt)
+        if new_y is None:
+            continue
+        moved = True
+        yield points, False, nxt, rem, new_y
+
+    if not moved:
+        # Terminal state, or every transition is illegal from this yard line
+        yield points, False, None, rem, y
+
+
+def explore_two_team(
+    states: States,
+    transitions: Transitions,
+    layout: ProductLayout,
+    start_state: str = "first down",
+    symmetric: bool = True,
+) -> Set[int]:
+    """
+    BFS over the two-team product model from a 0-0 kickoff with team 0 on offense.
+
+    Returns the set of reachable packed product states. With symmetric=True each
+    state is stored as its canonical_product_state, roughly halving the set.
+    """
+    start = pack_product_state(layout, layout.start_time, 0, start_state, layout.start_yardline, 0, 0)
+    visited: Set[int] = {start}
+    q: Deque[int] = deque([start])
+
+    while q:
+        clock, p, s, y, score_a, score_b = unpack_product_state(layout, q.popleft())
+        for points, flips, nxt, rem, new_y in two_team_successors(states, transitions, layout, s, clock, y):
+            if nxt is None:
+                continue
+            new_a = score_a + (points if p == 0 else 0)
+            new_b = score_b + (points if p == 1 else 0)
+            new_p = 1 - p if flips else p
+            code = pack_product_state(layout, rem, new_p, nxt, new_y, new_a, new_b)
+            if symmetric:
+                code = canonical_product_state(layout, code)
+            if code not in visited:
+                visited.add(code)
+                q.append(code)
+
+    return visited
+
+
+def solve_two_team(
+    states: States,
+    transitions: Transitions,
+    layout: ProductLayout,
+    start: int,
+    packed_keys: bool = True,
+) -> Tuple[int, int, int, Set[Outcome]]:
+    """
+    Outcomes for team 0 from the packed product state `start`.
+
+    Returns (best_margin, worst_margin, possession_margin, outcomes), all margins being
+    team 0's final score minus team 1's:
+      - best_margin / worst_margin: extremes over ALL complete games, i.e. with every
+        choice free. A positive best_margin means SOME sequence of plays wins, not
+        that team 0 can force it (team 1 may have to cooperate).
+      - possession_margin: minimax value where each team controls its own possessions.
+        The team with the ball picks its own transitions (including scoring from any
+        down); on a change of possession the receiving team picks how it leaves
+        `handoff` (new drive, safety, return TD). The defence never affects the
+        offence's drive, so this is a race for possessions, NOT a result either
+        team can force against a defending opponent.
+      - outcomes: reachable results ("win", "tie", "loss") for team 0, again over all games.
+
+    Points only ever add, so the future is solved per drive state (clock, state,
+    yardline) relative to the team with the ball: the set of reachable future
+    margins is kept as a bitset (bit m + score_bound set iff margin m is reachable)
+    and mirrored when possession flips. This is the same symmetry as
+    canonical_product_state, and it keeps the scores out of the memo key.
+    Memo keys are packed ints, or (clock, state, yardline) tuples with packed_keys=False.
+    """
+    bound = layout.score_bound
+    width = 2 * bound + 1
+    margins_memo: Dict[int | Tuple[int, str, int], int] = {}
+    value_memo: Dict[int | Tuple[int, str, int], int] = {}
+
+    def drive_key(t: int, s: str, y: int) -> int | Tuple[int, str, int]:
+        if packed_keys:
+            return pack_product_state(layout, t, 0, s, y, 0, 0)
+        return t, s, y
+
+    def mirror(margins: int) -> int:
+        # format() pads but never truncates, so a wider bitset would reverse wrongly
+        if margins.bit_length() > width:
+            raise ValueError("margins exceed score_bound; was the layout built for a shorter game?")
+        return int(format(margins, f"0{width}b")[::-1], 2)
+
+    def reachable(t: int, s: str, y: int) -> int:
+        key = drive_key(t, s, y)
+        if key in margins_memo:
+            return margins_memo[key]
+        margins = 0
+        for points, flips, nxt, rem, new_y in two_team_successors(states, transitions, layout, s, t, y):
+            if nxt is None:
+                margins |= 1 << (bound + points)
+                continue
+            child = reachable(rem, nxt, new_y)
+            if flips:
+                child = mirror(child)
+            margins |= child << points
+        if margins.bit_length() > width:
+            raise ValueError("margins exceed score_bound; was the layout built for a shorter game?")
+        margins_memo[key] = margins
+        return margins
+
+    def value(t: int, s: str, y: int) -> int:
+        key = drive_key(t, s, y)
+        if key in value_memo:
+            return value_memo[key]
+        best: float = float("-inf")
+        receiver_best: float = float("-inf")
+        handoff_points = 0
+        for points, flips, nxt, rem, new_y in two_team_successors(states, transitions, layout, s, t, y):
+            if nxt is None:
+                best = max(best, points)
+            elif flips:
+                # All flipping successors come from the one handoff transition
+                handoff_points = points
+                receiver_best = max(receiver_best, value(rem, nxt, new_y))
+            else:
+                best = max(best, points + value(rem, nxt, new_y))
+        if receiver_best != float("-inf"):
+            best = max(best, handoff_points - receiver_best)
+        value_memo[key] = int(best)
+        return int(best)
+
+    clock, p, s, y, score_a, score_b = unpack_product_state(layout, start)
+    future = reachable(clock, s, y)
+    possession = value(clock, s, y)
+    if p == 1:
+        future = mirror(future)
+        possession = -possession
+
+    lead = score_a - score_b
+    best_margin = lead + future.bit_length() - 1 - bound
+    worst_margin = lead + (future & -future).bit_length() - 1 - bound
+
+    outcomes: Set[Outcome] = set()
+    if best_margin > 0:
+        outcomes.add("win")
+    if worst_margin < 0:
+        outcomes.add("loss")
+    if 0 <= bound - lead < width and (future >> (bound - lead)) & 1:
+        outcomes.add("tie")
+    return best_margin, worst_margin, lead + possession, outcomes
+
+
+def check_two_team_solver(states: States, transitions: Transitions, max_time: int = 150) -> bool:
+    """
+    Cross-check the two-team encoding and solver against brute force on a short game:
+      - pack/unpack round-trips, and fields that don't fit raise ValueError,
+      - canonical_product_state gives the same game seen from the other team,
+      - from every drive state, both possessions and a few starting scores,
+        solve_two_team matches a direct search over full product states
+        (absolute scores, no bitsets, no mirroring).
+
+    Returns:
+        True if every check agrees, False otherwise.
+    """
+    start_scores = [(0, 0), (14, 7), (3, 10)]
+    layout = two_team_layout(states, transitions, max_time, max_start_score=14)
+
+    @lru_cache(maxsize=None)
+    def brute(t: int, p: int, s: str, y: int, score_a: int, score_b: int) -> Tuple[FrozenSet[int], int]:
+        """ (final margins for team 0 over all games, possession-control margin for team 0) """
+        finals: Set[int] = set()
+        options: List[int] = []
+        receiver_options: List[int] = []
+        for points, flips, nxt, rem, new_y in two_team_successors(states, transitions, layout, s, t, y):
+            new_a = score_a + (points if p == 0 else 0)
+            new_b = score_b + (points if p == 1 else 0)
+            if nxt is None:
+                finals.add(new_a - new_b)
+                options.append(new_a - new_b)
+                continue
+            child_finals, child_value = brute(rem, 1 - p if flips else p, nxt, new_y, new_a, new_b)
+            finals |= child_finals
+            (receiver_options if flips else options).append(child_value)
+        # Team 0 maximises the margin, team 1 minimises it; the receiving team picks after a handoff
+        if receiver_options:
+            options.append(max(receiver_options) if p == 1 else min(receiver_options))
+        return frozenset(finals), max(options) if p == 0 else min(options)
+
+    ok = True
+    for bad_args in [(layout.tick + 1, 0, "first down", 70, 0, 0),
+                     (max_time + layout.tick, 0, "first down", 70, 0, 0),
+                     (0, 0, "first down", 1 << layout.yard_bits, 0, 0),
+                     (0, 0, "first down", 70, 1 << layout.score_bits, 0),
+                     (0, 0, layout.handoff, 70, 0, 0)]:
+        try:
+            pack_product_state(layout, *bad_args)
+            ok = False
+        except ValueError:
+            pass
+
+    for t in range(0, max_time + 1, layout.tick):
+        for s in layout.names:
+            for y in range(10, 71, 10):
+                for p in (0, 1):
+                    for score_a, score_b in start_scores:
+                        code = pack_product_state(layout, t, p, s, y, score_a, score_b)
+                        if unpack_product_state(layout, code) != (t, p, s, y, score_a, score_b):
+                            ok = False
+
+                        best, worst, possession, outcomes = solve_two_team(states, transitions, layout, code)
+                        finals, value = brute(t, p, s, y, score_a, score_b)
+                        expected: Set[Outcome] = set()
+                        if max(finals) > 0:
+                            expected.add("win")
+                        if min(finals) < 0:
+                            expected.add("loss")
+                        if 0 in finals:
+                            expected.add("tie")
+                        if (best, worst, possession, outcomes) != (max(finals), min(finals), value, expected):
+                            ok = False
+
+                        # The same game seen from the team with the ball
+                        swapped = solve_two_team(states, transitions, layout, canonical_product_state(layout, code))
+                        if p == 1 and swapped[:3] != (-worst, -best, -possession):
+                            ok = False
+    return ok
+
+
+def traced_bytes(build: Callable[[], object]) -> Tuple[int, int]:
+    """
+    Returns (retained, peak) bytes allocated while running build(), where `retained`
+    is measured while its result is still alive.
+
+    Starts tracemalloc only if it is not already tracing, and only stops what it
+    started; an outer trace only loses its peak (reset_peak).
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    del result
+    if started:
+        tracemalloc.stop()
+    return current - before, peak - before
+
+
+def compare_product_encodings(
+    states: States,
+    transitions: Transitions,
+    layout: ProductLayout,
+    start_state: str = "first down",
+) -> Tuple[int, int, int, int]:
+    """
+    Measure the reachable product state space and what it costs to hold it.
+
+    Returns (num_states, num_canonical_states, tuple_set_bytes, packed_set_bytes)
+    where the byte counts are what tracemalloc sees retained by a set of unpacked
+    tuples and a set of packed ints over the same (non-symmetric) states.
+
+    The product grows roughly with the cube of the clock (time x score x score),
+    so keep layout.start_time short; use measure_two_team_memory for full games.
+    """
+    codes = explore_two_team(states, transitions, layout, start_state, symmetric=False)
+    canonical = explore_two_team(states, transitions, layout, start_state, symmetric=True)
+    tuples = [unpack_product_state(layout, c) for c in codes]
+
+    # Build each set from the other representation so its keys are allocated under the trace
+    tuple_bytes, _ = traced_bytes(lambda: {unpack_product_state(layout, c) for c in codes})
+    int_bytes, _ = traced_bytes(lambda: {pack_product_state(layout, *u) for u in tuples})
+    return len(codes), len(canonical), tuple_bytes, int_bytes
+
+
+def measure_two_team_memory(
+    states: States,
+    transitions: Transitions,
+    layout: ProductLayout,
+    start_state: str = "first down",
+) -> Tuple[int, int, int]:
+    """
+    Solver-memo memory (not product-state memory) for a full 0-0 game of layout.start_time.
+
+    Returns (memo_entries, tuple_key_bytes, packed_key_bytes): the number of drive
+    states (clock, state, yardline) the solver memoises, and the peak bytes traced
+    while solve_two_team runs with each memo key encoding. Scores are not part of
+    the key, and the margin bitsets stored as values dominate both byte counts.
+    """
+    start = pack_product_state(layout, layout.start_time, 0, start_state, layout.start_yardline, 0, 0)
+
+    # The memo holds exactly the drive states reachable from the kickoff
+    first = (layout.start_time, start_state, layout.start_yardline)
+    drive_states: Set[Tuple[int, str, int]] = {first}
+    q: Deque[Tuple[int, str, int]] = deque([first])
+    while q:
+        t, s, y = q.popleft()
+        for _, _, nxt, rem, new_y in two_team_successors(states, transitions, layout, s, t, y):
+            if nxt is not None and (rem, nxt, new_y) not in drive_states:
+                drive_states.add((rem, nxt, new_y))
+                q.append((rem, nxt, new_y))
+
+    _, tuple_bytes = traced_bytes(lambda: solve_two_team(states, transitions, layout, start, packed_keys=False))
+    _, int_bytes = traced_bytes(lambda: solve_two_team(states, transitions, layout, start))
+    return len(drive_states), tuple_bytes, int_bytes
+
 
 def main():
     states = {
@@ -666,6 +1188,33 @@ def main():
     else:
         print("No bad dead-end states: from every state we can finish the game.")
 
+    print("################################################")
+    layout = two_team_layout(states, transitions, start_time, max_start_score=14)
+    kickoff = pack_product_state(layout, start_time, 0, start_state, layout.start_yardline, 0, 0)
+    best_margin, worst_margin, possession_margin, outcomes = solve_two_team(states, transitions, layout, kickoff)
+    print("Two-team game, team 0 receives:")
+    print("  margin range over all play sequences:", worst_margin, "to", best_margin)
+    print("  outcomes some play sequence reaches:", ", ".join(sorted(outcomes)))
+    print("  margin if each team controls its own possessions (not forced):", possession_margin)
+
+    # Trailing 0-14 with two minutes left and the leader on offense
+    trailing = pack_product_state(layout, 120, 1, start_state, layout.start_yardline, 0, 14)
+    best_margin, _, _, outcomes = solve_two_team(states, transitions, layout, trailing)
+    if "win" in outcomes:
+        print(f"Down 0-14 with 2:00 left on defense, some play sequence still wins for team 0 (best margin {best_margin}).")
+    else:
+        print(f"Down 0-14 with 2:00 left on defense, no play sequence wins for team 0 (best margin {best_margin}).")
+
+    print("Two-team solver agrees with brute force on a short game:", check_two_team_solver(states, transitions))
+
+    short_layout = two_team_layout(states, transitions, 600)
+    num_states, num_canonical, tuple_bytes, int_bytes = compare_product_encodings(states, transitions, short_layout)
+    print(f"Product states in a {short_layout.start_time}s game: {num_states} ({num_canonical} after symmetry reduction)")
+    print(f"  tuple set: {tuple_bytes} bytes, packed int set: {int_bytes} bytes")
+    memo_entries, tuple_bytes, int_bytes = measure_two_team_memory(states, transitions, layout)
+    print(f"Solver memo for a full {start_time}s game: {memo_entries} drive states (no scores),")
+    print(f"  peak {tuple_bytes} bytes with tuple keys, {int_bytes} bytes with packed keys")
+
 
 
 